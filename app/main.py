@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, Response
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
-from sqlalchemy import DateTime, Integer, Text, create_engine, select
-from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from sqlalchemy import DateTime, Integer, Text, create_engine, event, func, insert, inspect, select, update
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from app.services.generator import ImageGenerator
 
@@ -22,7 +31,38 @@ CONTEXT_PATH = BASE_DIR / "context.md"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+engine = create_engine(
+    f"sqlite:///{DB_PATH}",
+    poolclass=QueuePool,
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=True,
+    connect_args={"check_same_thread": False, "timeout": 30},
+)
+
+
+# WAL and mmap need shared memory that network filesystems (e.g. the SMB-backed
+# /home on Azure App Service) do not provide, so they are controlled by SQLITE_WAL
+# and default to off when running on App Service.
+_default_wal = "0" if os.getenv("WEBSITE_SITE_NAME") else "1"
+SQLITE_WAL = (os.getenv("SQLITE_WAL") or _default_wal).strip().lower() not in {"0", "false", "no", "off"}
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, _connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA mmap_size=134217728")
+    else:
+        cursor.execute("PRAGMA journal_mode=DELETE")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.close()
+
+
+SessionLocal = sessionmaker(engine)
 
 
 class Base(DeclarativeBase):
@@ -37,11 +77,29 @@ class Saying(Base):
     prompt: Mapped[str] = mapped_column(Text, nullable=False)
     image_path: Mapped[str | None] = mapped_column(Text, nullable=True)
     updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    status: Mapped[str | None] = mapped_column(Text, nullable=True)
+    status_detail: Mapped[str | None] = mapped_column(Text, nullable=True)
 
 
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+INTERRUPTED_DETAIL = "Image generation was interrupted by a server restart."
+
 Base.metadata.create_all(engine)
 
 
+def _add_missing_columns() -> None:
+    existing = {c["name"] for c in inspect(engine).get_columns(Saying.__tablename__)}
+    with engine.begin() as conn:
+        for name in ("status", "status_detail"):
+            if name not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE {Saying.__tablename__} ADD COLUMN {name} TEXT")
+
+
+_add_missing_columns()
+
+
 class SayingCreate(BaseModel):
     saying: str = Field(min_length=1)
     prompt: str = Field(min_length=1)
@@ -58,6 +116,8 @@ class SayingOut(BaseModel):
     prompt: str
     image_path: str | None
     updated_at: datetime
+    status: str | None = None
+    status_detail: str | None = None
 
 
 class ImportExportItem(BaseModel):
@@ -73,7 +133,49 @@ class ExportPayload(BaseModel):
     sayings: list[ImportExportItem]
 
 
-app = FastAPI(title="Sayings Image Generator", version="1.0.0")
+generator = ImageGenerator(images_dir=IMAGES_DIR)
+generation_slots = asyncio.Semaphore(max(1, int(os.getenv("GENERATION_CONCURRENCY") or 4)))
+generation_tasks: set[asyncio.Task[None]] = set()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    await run_in_threadpool(_fail_interrupted_generations)
+    await generator.startup()
+    try:
+        yield
+    finally:
+        for task in list(generation_tasks):
+            task.cancel()
+        await asyncio.gather(*generation_tasks, return_exceptions=True)
+        await generator.shutdown()
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Static files whose names never get reused, so clients may cache them forever."""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+class SkipImagesGZipMiddleware(GZipMiddleware):
+    """Gzip responses except generated PNGs under /images, which are already compressed."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith("/images/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app = FastAPI(
+    title="Sayings Image Generator",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -81,11 +183,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(SkipImagesGZipMiddleware, minimum_size=500, compresslevel=5)
 
 app.mount("/static", StaticFiles(directory=BASE_DIR / "app" / "static"), name="static")
-app.mount("/images", StaticFiles(directory=IMAGES_DIR), name="images")
+app.mount("/images", ImmutableStaticFiles(directory=IMAGES_DIR), name="images")
+
+
+@lru_cache(maxsize=1)
+def _load_context(mtime: float) -> str:
+    return CONTEXT_PATH.read_text(encoding="utf-8")
 
-generator = ImageGenerator(images_dir=IMAGES_DIR)
+
+def load_context() -> str:
+    try:
+        mtime = CONTEXT_PATH.stat().st_mtime
+    except FileNotFoundError:
+        return ""
+    return _load_context(mtime)
 
 
 def to_out(model: Saying) -> SayingOut:
@@ -95,6 +209,8 @@ def to_out(model: Saying) -> SayingOut:
         prompt=model.prompt,
         image_path=model.image_path,
         updated_at=model.updated_at,
+        status=model.status,
+        status_detail=model.status_detail,
     )
 
 
@@ -103,95 +219,197 @@ def index() -> FileResponse:
     return FileResponse(BASE_DIR / "app" / "static" / "index.html")
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {c.strip() for c in header.split(",")}
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+
 @app.get("/api/sayings", response_model=list[SayingOut])
-def list_sayings() -> list[SayingOut]:
-    with Session(engine) as session:
-        rows = session.execute(select(Saying).order_by(Saying.id.asc())).scalars().all()
-        return [to_out(r) for r in rows]
+def list_sayings(request: Request, response: Response) -> list[SayingOut] | Response:
+    with SessionLocal() as session:
+        count, max_id, max_updated = session.execute(
+            select(func.count(), func.max(Saying.id), func.max(Saying.updated_at))
+        ).one()
+        digest = hashlib.sha1(f"{count}:{max_id}:{max_updated}".encode()).hexdigest()
+        etag = f'W/"{digest}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+        rows = session.execute(
+            select(
+                Saying.id,
+                Saying.saying,
+                Saying.prompt,
+                Saying.image_path,
+                Saying.updated_at,
+                Saying.status,
+                Saying.status_detail,
+            )
+            .order_by(Saying.id.asc())
+        )
+        return [SayingOut(**r._mapping) for r in rows]
+
+
+@app.get("/api/sayings/{saying_id}", response_model=SayingOut)
+def get_saying(saying_id: int) -> SayingOut:
+    with SessionLocal() as session:
+        row = session.get(Saying, saying_id)
+        if not row:
+            raise HTTPException(status_code=404, detail="Saying not found")
+        return to_out(row)
 
 
 @app.post("/api/sayings", response_model=SayingOut, status_code=201)
 def create_saying(payload: SayingCreate) -> SayingOut:
     now = datetime.utcnow()
-    with Session(engine) as session:
+    with SessionLocal() as session, session.begin():
         row = Saying(saying=payload.saying, prompt=payload.prompt, updated_at=now)
         session.add(row)
-        session.commit()
-        session.refresh(row)
-        return to_out(row)
+        session.flush()
+        out = to_out(row)
+    return out
 
 
 @app.put("/api/sayings/{saying_id}", response_model=SayingOut)
 def update_saying(saying_id: int, payload: SayingUpdate) -> SayingOut:
-    with Session(engine) as session:
+    with SessionLocal() as session, session.begin():
         row = session.get(Saying, saying_id)
         if not row:
             raise HTTPException(status_code=404, detail="Saying not found")
         row.saying = payload.saying
         row.prompt = payload.prompt
         row.updated_at = datetime.utcnow()
-        session.commit()
-        session.refresh(row)
-        return to_out(row)
+        session.flush()
+        out = to_out(row)
+    return out
 
 
 @app.delete("/api/sayings/{saying_id}", status_code=204, response_class=Response)
-def delete_saying(saying_id: int) -> Response:
-    with Session(engine) as session:
+def delete_saying(saying_id: int, background_tasks: BackgroundTasks) -> Response:
+    with SessionLocal() as session, session.begin():
         row = session.get(Saying, saying_id)
         if not row:
             raise HTTPException(status_code=404, detail="Saying not found")
-        if row.image_path:
-            maybe_image = BASE_DIR / row.image_path.lstrip("/")
-            if maybe_image.exists():
-                maybe_image.unlink(missing_ok=True)
+        image_path = row.image_path
         session.delete(row)
-        session.commit()
+    if image_path:
+        background_tasks.add_task(_remove_image, IMAGES_DIR / Path(image_path).name)
     return Response(status_code=204)
 
 
-@app.post("/api/sayings/{saying_id}/generate", response_model=SayingOut)
-def generate_saying_image(saying_id: int) -> SayingOut:
-    context_md = CONTEXT_PATH.read_text(encoding="utf-8") if CONTEXT_PATH.exists() else ""
+def _remove_image(path: Path) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
 
-    with Session(engine) as session:
+@app.post("/api/sayings/{saying_id}/generate", response_model=SayingOut, status_code=202)
+async def generate_saying_image(saying_id: int) -> SayingOut:
+    final_prompt, out = await run_in_threadpool(_start_generation, saying_id)
+    task = asyncio.create_task(_do_generate(saying_id, final_prompt))
+    generation_tasks.add(task)
+    task.add_done_callback(generation_tasks.discard)
+    return out
+
+
+def _start_generation(saying_id: int) -> tuple[str, SayingOut]:
+    context_md = load_context()
+
+    with SessionLocal() as session, session.begin():
         row = session.get(Saying, saying_id)
         if not row:
             raise HTTPException(status_code=404, detail="Saying not found")
-
+        if row.status == STATUS_PENDING:
+            raise HTTPException(status_code=409, detail="Image generation already in progress")
         final_prompt = f"{context_md}\n{row.prompt.replace('%1', row.saying)}".strip()
-        try:
-            new_image_path = generator.generate_image(saying_id=row.id, prompt=final_prompt)
-        except RuntimeError as exc:
-            raise HTTPException(status_code=502, detail=str(exc)) from exc
-        except Exception as exc:
-            raise HTTPException(status_code=502, detail=f"Image generation failed: {exc}") from exc
-        row.image_path = f"/images/{new_image_path.name}"
+        row.status = STATUS_PENDING
+        row.status_detail = None
         row.updated_at = datetime.utcnow()
-        session.commit()
-        session.refresh(row)
-        return to_out(row)
+        session.flush()
+        out = to_out(row)
+    return final_prompt, out
+
+
+async def _do_generate(saying_id: int, prompt: str) -> None:
+    try:
+        async with generation_slots:
+            new_image_path = await generator.generate_image_async(saying_id=saying_id, prompt=prompt)
+    except asyncio.CancelledError:
+        await run_in_threadpool(
+            _finish_generation, saying_id, STATUS_FAILED, detail=INTERRUPTED_DETAIL
+        )
+        raise
+    except RuntimeError as exc:
+        await run_in_threadpool(_finish_generation, saying_id, STATUS_FAILED, detail=str(exc))
+        return
+    except Exception as exc:
+        await run_in_threadpool(
+            _finish_generation, saying_id, STATUS_FAILED, detail=f"Image generation failed: {exc}"
+        )
+        return
+
+    image_path = f"/images/{new_image_path.name}"
+    if not await run_in_threadpool(_finish_generation, saying_id, STATUS_READY, image_path=image_path):
+        new_image_path.unlink(missing_ok=True)
+
+
+def _finish_generation(
+    saying_id: int,
+    status: str,
+    image_path: str | None = None,
+    detail: str | None = None,
+) -> bool:
+    with SessionLocal() as session, session.begin():
+        row = session.get(Saying, saying_id)
+        if not row:
+            return False
+        if image_path:
+            row.image_path = image_path
+        row.status = status
+        row.status_detail = detail
+        row.updated_at = datetime.utcnow()
+    return True
+
+
+def _fail_interrupted_generations() -> None:
+    # Generation tasks live in this process, so any row still pending at startup
+    # was orphaned by a restart. This assumes a single worker process: with
+    # several workers or overlapping instances sharing the database, a starting
+    # process would fail the others' in-flight generations.
+    with SessionLocal() as session, session.begin():
+        session.execute(
+            update(Saying)
+            .where(Saying.status == STATUS_PENDING)
+            .values(status=STATUS_FAILED, status_detail=INTERRUPTED_DETAIL, updated_at=datetime.utcnow())
+        )
 
 
 @app.get("/api/export", response_model=ExportPayload)
 def export_sayings() -> ExportPayload:
-    with Session(engine) as session:
-        rows = session.execute(select(Saying).order_by(Saying.id.asc())).scalars().all()
-        return ExportPayload(sayings=[ImportExportItem(saying=r.saying, prompt=r.prompt) for r in rows])
+    with SessionLocal() as session:
+        rows = session.execute(select(Saying.saying, Saying.prompt).order_by(Saying.id.asc()))
+        return ExportPayload(sayings=[ImportExportItem(saying=s, prompt=p) for s, p in rows])
 
 
 @app.post("/api/import", response_model=list[SayingOut])
 def import_sayings(payload: ImportPayload) -> list[SayingOut]:
-    imported: list[SayingOut] = []
-    with Session(engine) as session:
-        for item in payload.sayings:
-            row = Saying(
-                saying=item.saying,
-                prompt=item.prompt,
-                updated_at=datetime.utcnow(),
-            )
-            session.add(row)
-            session.flush()
-            imported.append(to_out(row))
-        session.commit()
-    return imported
+    if not payload.sayings:
+        return []
+
+    now = datetime.utcnow()
+    rows = [{"saying": item.saying, "prompt": item.prompt, "updated_at": now} for item in payload.sayings]
+    with SessionLocal() as session, session.begin():
+        ids = session.scalars(
+            insert(Saying).returning(Saying.id, sort_by_parameter_order=True),
+            rows,
+        ).all()
+    return [
+        SayingOut(id=row_id, saying=item.saying, prompt=item.prompt, image_path=None, updated_at=now)
+        for row_id, item in zip(ids, payload.sayings)
+    ]
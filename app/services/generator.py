@@ -1,12 +1,13 @@
 from __future__ import annotations
 
 import base64
-import json
 import os
 from datetime import datetime
 from pathlib import Path
-from urllib.error import HTTPError, URLError
-from urllib.request import Request, urlopen
+
+import httpx
+
+CHUNK_SIZE = 64 * 1024
 
 
 class ImageGenerator:
@@ -22,19 +23,41 @@ class ImageGenerator:
         self.size = (os.getenv("OPENAI_IMAGE_SIZE") or "1024x1024").strip()
         self.timeout = self._read_int_env("OPENAI_TIMEOUT_SECONDS", default=120)
 
-    def generate_image(self, saying_id: int, prompt: str) -> Path:
+        self._client: httpx.AsyncClient | None = None
+
+    async def startup(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20),
+            )
+
+    async def shutdown(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def generate_image_async(self, saying_id: int, prompt: str) -> Path:
         if not self.api_key:
             raise RuntimeError("OPENAI_API_KEY is missing. Set it before generating images.")
 
-        timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+        timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
         filename = f"saying_{saying_id}_{timestamp}.png"
         output = self.images_dir / filename
 
-        image_bytes = self._generate_via_api(prompt=prompt)
-        output.write_bytes(image_bytes)
+        try:
+            await self._generate_via_api(prompt=prompt, output=output)
+        except BaseException:
+            output.unlink(missing_ok=True)
+            raise
         return output
 
-    def _generate_via_api(self, prompt: str) -> bytes:
+    async def _generate_via_api(self, prompt: str, output: Path) -> None:
+        if self._client is None:
+            await self.startup()
+        client = self._client
+
         endpoint = f"{self.base_url}/images/generations"
         payload = {
             "model": self.model,
@@ -43,46 +66,54 @@ class ImageGenerator:
             "n": 1,
         }
 
-        req = Request(
-            endpoint,
-            data=json.dumps(payload).encode("utf-8"),
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            },
-            method="POST",
-        )
-
         try:
-            with urlopen(req, timeout=self.timeout) as response:
-                body = response.read()
-        except HTTPError as exc:
-            detail = exc.read().decode("utf-8", errors="replace")
-            raise RuntimeError(f"Image API request failed ({exc.code}): {detail}") from exc
-        except URLError as exc:
-            raise RuntimeError(f"Image API connection failed: {exc.reason}") from exc
+            response = await client.post(
+                endpoint,
+                json=payload,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        except httpx.HTTPError as exc:
+            raise RuntimeError(f"Image API connection failed: {exc}") from exc
+
+        if response.is_error:
+            raise RuntimeError(f"Image API request failed ({response.status_code}): {response.text}")
 
         try:
-            parsed = json.loads(body.decode("utf-8"))
-            item = parsed["data"][0]
+            item = response.json()["data"][0]
         except Exception as exc:
             raise RuntimeError("Image API returned invalid JSON payload.") from exc
 
         if "b64_json" in item and item["b64_json"]:
             try:
-                return base64.b64decode(item["b64_json"])
+                self._write_b64(item["b64_json"], output)
+                return
             except Exception as exc:
                 raise RuntimeError("Image API returned invalid base64 image payload.") from exc
 
         if "url" in item and item["url"]:
             try:
-                with urlopen(item["url"], timeout=self.timeout) as image_response:
-                    return image_response.read()
+                async with client.stream("GET", item["url"]) as image_response:
+                    image_response.raise_for_status()
+                    with output.open("wb") as fh:
+                        async for chunk in image_response.aiter_bytes(CHUNK_SIZE):
+                            fh.write(chunk)
+                return
             except Exception as exc:
                 raise RuntimeError("Image API returned URL but image download failed.") from exc
 
         raise RuntimeError("Image API response contained no image data.")
 
+    @staticmethod
+    def _write_b64(data: str, output: Path) -> None:
+        # The encoded string is already in memory from response.json(); decoding in
+        # 4-aligned slices just avoids a second full-size copy of the raw bytes.
+        # Whitespace is removed first so line-wrapped payloads keep their alignment.
+        data = "".join(data.split())
+        step = CHUNK_SIZE // 3 * 4
+        with output.open("wb") as fh:
+            for start in range(0, len(data), step):
+                fh.write(base64.b64decode(data[start : start + step]))
+
     @staticmethod
     def _read_int_env(name: str, default: int) -> int:
         raw = os.getenv(name)
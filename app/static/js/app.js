@@ -52,6 +52,10 @@ const api = {
       throw new Error(`Delete failed with status ${r.status}`);
     }
   },
+  async get(id) {
+    const r = await fetch(`/api/sayings/${id}`);
+    return parseResponse(r);
+  },
   async generate(id) {
     const r = await fetch(`/api/sayings/${id}/generate`, { method: "POST" });
     return parseResponse(r);
@@ -70,6 +74,20 @@ const api = {
   },
 };
 
+const POLL_INTERVAL_MS = 2000;
+const MAX_POLL_ATTEMPTS = 150;
+
+async function waitForGeneration(id) {
+  for (let attempt = 0; attempt < MAX_POLL_ATTEMPTS; attempt++) {
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+    const item = await api.get(id);
+    if (item.status !== "pending") {
+      return item;
+    }
+  }
+  throw new Error("Timed out waiting for the image");
+}
+
 function setStatus(message, isError = false) {
   statusEl.textContent = message;
   statusEl.style.color = isError ? "#8f3030" : "#2f7f5f";
@@ -94,7 +112,7 @@ function renderItem(item) {
       downloadBtn.style.display = "none";
       return;
     }
-    const src = `${path}?t=${Date.now()}`;
+    const src = path;
     previewEl.src = src;
     previewEl.style.display = "block";
     downloadBtn.href = src;
@@ -118,11 +136,18 @@ function renderItem(item) {
     }
   });
 
-  genBtn.addEventListener("click", async () => {
+  const trackGeneration = async (start) => {
     try {
       genBtn.disabled = true;
-      const updated = await api.generate(item.id);
+      if (start) {
+        await api.generate(item.id);
+      }
+      setStatus(`Generating image for #${item.id}...`);
+      const updated = await waitForGeneration(item.id);
       item = updated;
+      if (item.status === "failed") {
+        throw new Error(item.status_detail || "Unknown error");
+      }
       applyImage(item.image_path);
       setStatus(`Generated image for #${item.id}`);
     } catch (err) {
@@ -130,7 +155,13 @@ function renderItem(item) {
     } finally {
       genBtn.disabled = false;
     }
-  });
+  };
+
+  genBtn.addEventListener("click", () => trackGeneration(true));
+
+  if (item.status === "pending") {
+    trackGeneration(false);
+  }
 
   delBtn.addEventListener("click", async () => {
     try {